@@ -1,6 +1,7 @@
 import os
 import sqlite3
 import hashlib
+import secrets
 from functools import wraps
 from datetime import datetime, timedelta
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify
@@ -15,6 +16,11 @@ app.permanent_session_lifetime = timedelta(days=30)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "database.db")
+# Tombstones older than this many change seqs are pruned; clients further behind
+# get a full snapshot instead of a delta.
+CHANGES_WINDOW = 5000
+# Only the newest movements are kept in the change feed (the stock page shows 50).
+MOVEMENTS_FEED_LIMIT = 50
 print("USING DATABASE:", os.path.abspath("database.db"))
 
 
@@ -98,6 +104,8 @@ def init_db():
         """
     )
 
+    init_change_feed(cur)
+
     cur.execute("PRAGMA table_info(users)")
     cols = {row[1] for row in cur.fetchall()}
 
@@ -145,6 +153,68 @@ def init_db():
     conn.commit()
     conn.close()
 
+def init_change_feed(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL
+        )
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_changes_entity_row ON changes(entity, row_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_changes_op_seq ON changes(op, seq)")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """
+    )
+    # Each start (or recreated/restored database) gets a new epoch, so cached
+    # client seqs from another history are never applied as deltas.
+    cur.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('epoch', ?)", (secrets.token_hex(8),))
+    cur.execute("INSERT OR IGNORE INTO meta(key, value) VALUES('pruned_seq', '0')")
+
+    # Every write to items/suppliers moves the row to a fresh seq and deletes
+    # leave a tombstone, so /api/changes only has to look at what changed.
+    for entity, table, key in (("item", "items", "id"), ("supplier", "suppliers", "supplier_id")):
+        for event, ref, op in (("INSERT", "NEW", "upsert"), ("UPDATE", "NEW", "upsert"), ("DELETE", "OLD", "delete")):
+            cur.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_changes_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    DELETE FROM changes WHERE entity='{entity}' AND row_id={ref}.{key};
+                    INSERT INTO changes(entity, row_id, op) VALUES('{entity}', {ref}.{key}, '{op}');
+                END
+                """
+            )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS movements_changes_insert
+        AFTER INSERT ON movements
+        BEGIN
+            DELETE FROM changes WHERE entity='movement' AND row_id <= NEW.id - {limit};
+            INSERT INTO changes(entity, row_id, op) VALUES('movement', NEW.id, 'insert');
+        END
+        """.format(limit=MOVEMENTS_FEED_LIMIT)
+    )
+    prune_changes(cur)
+
+def prune_changes(cur):
+    head = cur.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+    cutoff = head - CHANGES_WINDOW
+    cur.execute("DELETE FROM changes WHERE op='delete' AND seq <= ?", (cutoff,))
+    if cur.rowcount > 0:
+        cur.execute(
+            "UPDATE meta SET value=? WHERE key='pruned_seq' AND CAST(value AS INTEGER) < ?",
+            (str(cutoff), cutoff),
+        )
+
 def login_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -171,6 +241,14 @@ def ensure_db():
     if not os.path.exists(DB_PATH):
         open(DB_PATH, "a").close()
         init_db()
+    elif not app.config.get("CHANGE_FEED_READY"):
+        # Databases created before the change feed existed get its tables and
+        # triggers on the first request, however the app was launched.
+        conn = get_db()
+        init_change_feed(conn.cursor())
+        conn.commit()
+        conn.close()
+    app.config["CHANGE_FEED_READY"] = True
 
 @app.before_request
 def session_timeout():
@@ -259,12 +337,7 @@ def dashboard():
 @app.route("/items", methods=["GET"]) 
 @login_required
 def items():
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT id, name, sku, price, qty FROM items ORDER BY id DESC")
-    items = cur.fetchall()
-    conn.close()
-    return render_template("items.html", items=items)
+    return render_template("items.html")
 
 @app.route("/items/<int:item_id>/edit", methods=["GET", "POST"]) 
 @admin_required
@@ -333,6 +406,7 @@ def items_delete(item_id):
     conn = get_db()
     cur = conn.cursor()
     cur.execute("DELETE FROM items WHERE id=?", (item_id,))
+    prune_changes(cur)
     conn.commit()
     conn.close()
     log_action(session["user_id"], f"Deleted item {item_id}")
@@ -341,8 +415,6 @@ def items_delete(item_id):
 @app.route("/stock", methods=["GET", "POST"]) 
 @login_required
 def stock():
-    conn = get_db()
-    cur = conn.cursor()
     if request.method == "POST":
         item_id = request.form.get("item_id")
         change = request.form.get("change")
@@ -354,6 +426,8 @@ def stock():
             item_id_val = None
             change_val = None
         if item_id_val and change_val:
+            conn = get_db()
+            cur = conn.cursor()
             cur.execute("SELECT qty FROM items WHERE id=?", (item_id_val,))
             row = cur.fetchone()
             if row:
@@ -370,14 +444,8 @@ def stock():
                     (item_id_val, "IN" if change_val >= 0 else "OUT", abs(change_val)),
                 )
                 conn.commit()
-    cur.execute("SELECT id, name, qty FROM items ORDER BY name ASC")
-    items = cur.fetchall()
-    cur.execute(
-        "SELECT m.id, i.name AS item_name, m.change, m.note, m.created_at FROM movements m JOIN items i ON i.id = m.item_id ORDER BY m.id DESC LIMIT 50"
-    )
-    movements = cur.fetchall()
-    conn.close()
-    return render_template("stock.html", items=items, movements=movements)
+            conn.close()
+    return render_template("stock.html")
 
 @app.route('/suppliers')
 def suppliers_page():
@@ -411,6 +479,7 @@ def api_supplier_delete(sid):
     conn = get_db()
     cur = conn.cursor()
     cur.execute('DELETE FROM suppliers WHERE supplier_id=?', (sid,))
+    prune_changes(cur)
     conn.commit()
     conn.close()
     return jsonify({"status":"deleted"})
@@ -464,11 +533,83 @@ def api_delete_item(item_id):
     conn = get_db()
     cur = conn.cursor()
     cur.execute('DELETE FROM items WHERE id=?', (item_id,))
+    prune_changes(cur)
     conn.commit()
     conn.close()
     log_action(session["user_id"], f"Deleted item {item_id}")
     return jsonify({"status": "deleted"})
 
+@app.route('/api/changes', methods=['GET'])
+@login_required
+def api_changes():
+    try:
+        since = int(request.args.get('since', 0))
+    except Exception:
+        since = 0
+    client_epoch = request.args.get('epoch', '')
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        # One read transaction, so the head, the prune mark and the rows all
+        # come from the same snapshot.
+        cur.execute('BEGIN')
+        meta = {r['key']: r['value'] for r in cur.execute('SELECT key, value FROM meta')}
+        epoch = meta.get('epoch', '')
+        pruned_seq = int(meta.get('pruned_seq') or 0)
+        seq = cur.execute('SELECT COALESCE(MAX(seq), 0) AS s FROM changes').fetchone()['s']
+        full = client_epoch != epoch or since <= 0 or since > seq or since < pruned_seq
+        item_sql = 'SELECT id, name, description, qty AS quantity, reorder_level, price, supplier_id FROM items'
+        # Movements of deleted items are not shown, so drop them before the limit.
+        movement_sql = (
+            'SELECT m.id, m.item_id, m.change, m.note, m.created_at '
+            'FROM movements m JOIN items i ON i.id = m.item_id'
+        )
+        if full:
+            items = cur.execute(item_sql + ' ORDER BY id DESC').fetchall()
+            suppliers = cur.execute('SELECT * FROM suppliers').fetchall()
+            deleted_items = []
+            deleted_suppliers = []
+        else:
+            changed = 'SELECT row_id FROM changes WHERE entity=? AND op=? AND seq > ?'
+            items = cur.execute(
+                item_sql + f' WHERE id IN ({changed}) ORDER BY id DESC',
+                ('item', 'upsert', since)
+            ).fetchall()
+            suppliers = cur.execute(
+                f'SELECT * FROM suppliers WHERE supplier_id IN ({changed})',
+                ('supplier', 'upsert', since)
+            ).fetchall()
+            deleted_items = [r['row_id'] for r in cur.execute(changed, ('item', 'delete', since))]
+            deleted_suppliers = [r['row_id'] for r in cur.execute(changed, ('supplier', 'delete', since))]
+        # A deleted item takes its movements out of the list, so the client
+        # needs the whole latest page again rather than just the new rows.
+        movements_full = full or bool(deleted_items)
+        if movements_full:
+            movements = cur.execute(
+                movement_sql + ' ORDER BY m.id DESC LIMIT ?', (MOVEMENTS_FEED_LIMIT,)
+            ).fetchall()
+        else:
+            movements = cur.execute(
+                movement_sql + f' WHERE m.id IN ({changed}) ORDER BY m.id DESC LIMIT ?',
+                ('movement', 'insert', since, MOVEMENTS_FEED_LIMIT)
+            ).fetchall()
+    finally:
+        # Rolling back ends the read transaction even if a query failed
+        # mid-way; close() alone can leave the lock held.
+        conn.rollback()
+        conn.close()
+    return jsonify({
+        "epoch": epoch,
+        "seq": seq,
+        "full": full,
+        "items": [dict(r) for r in items],
+        "deleted_items": deleted_items,
+        "suppliers": [dict(r) for r in suppliers],
+        "deleted_suppliers": deleted_suppliers,
+        "movements": [dict(r) for r in movements],
+        "movements_full": movements_full,
+    })
+
 @app.route('/export_report')
 def export_report():
     if 'user_id' not in session:
@@ -588,6 +729,7 @@ def reset_db():
     db.execute("DELETE FROM suppliers")
     db.execute("DELETE FROM stock_transactions")
     db.execute("DELETE FROM sqlite_sequence WHERE name IN('items','suppliers','stock_transactions')")
+    prune_changes(db.cursor())
     db.commit()
     log_action(session["user_id"], "Reset database")
 
@@ -1,11 +1,83 @@
-async function loadItems() {
-  const res = await fetch('/api/items');
+// Local copy of items/suppliers/recent movements kept in step with
+// /api/changes, so a page load only pulls the rows that changed since the
+// last visit. Kept in sessionStorage so it goes away with the browser
+// session, and on window so loading this script twice is harmless.
+window.changeCache ??= loadChangeCache();
+
+function loadChangeCache() {
+  try {
+    const saved = JSON.parse(sessionStorage.getItem('ims-change-cache') || 'null');
+    if (saved) {
+      return {
+        epoch: saved.epoch || '',
+        seq: saved.seq,
+        items: new Map(saved.items),
+        suppliers: new Map(saved.suppliers),
+        movements: saved.movements || []
+      };
+    }
+  } catch (e) {
+    // fall through to an empty cache
+  }
+  return { epoch: '', seq: 0, items: new Map(), suppliers: new Map(), movements: [] };
+}
+
+function saveChangeCache() {
+  try {
+    sessionStorage.setItem('ims-change-cache', JSON.stringify({
+      epoch: changeCache.epoch,
+      seq: changeCache.seq,
+      items: [...changeCache.items],
+      suppliers: [...changeCache.suppliers],
+      movements: changeCache.movements
+    }));
+  } catch (e) {
+    // storage full or disabled; the in-memory cache still works
+  }
+}
+
+async function syncChanges() {
+  const params = new URLSearchParams({ since: changeCache.seq, epoch: changeCache.epoch });
+  const res = await fetch(`/api/changes?${params}`);
   const data = await res.json();
+  if (data.full) {
+    changeCache.items.clear();
+    changeCache.suppliers.clear();
+  }
+  if (data.movements_full) {
+    changeCache.movements = [];
+  }
+  data.suppliers.forEach(s => changeCache.suppliers.set(s.supplier_id, s));
+  data.deleted_suppliers.forEach(id => changeCache.suppliers.delete(id));
+  data.items.forEach(i => changeCache.items.set(i.id, i));
+  data.deleted_items.forEach(id => changeCache.items.delete(id));
+  const seen = new Set(data.movements.map(m => m.id));
+  changeCache.movements = data.movements
+    .concat(changeCache.movements.filter(m => !seen.has(m.id)))
+    .sort((a, b) => b.id - a.id)
+    .slice(0, 50);
+  changeCache.epoch = data.epoch;
+  changeCache.seq = data.seq;
+  saveChangeCache();
+}
+
+function cachedItems() {
+  return [...changeCache.items.values()].sort((a, b) => b.id - a.id);
+}
+
+function cachedSuppliers() {
+  return [...changeCache.suppliers.values()].sort((a, b) => a.supplier_id - b.supplier_id);
+}
+
+async function loadItems() {
+  await syncChanges();
+  const data = cachedItems();
   const tbody = document.querySelector('#items-table tbody');
   if (tbody) {
     tbody.innerHTML = '';
     data.forEach(i => {
       const tr = document.createElement('tr');
+      const supplier = changeCache.suppliers.get(i.supplier_id);
       const editHtml = (window.isAdmin ? `<a href="/items/${i.id}/edit" class="btn">Edit</a>` : '');
       const deleteHtml = (window.isAdmin ? `<button onclick="deleteItem(${i.id})"><svg class="icon" viewBox="0 0 24 24" aria-hidden="true"><path d="M10 3v3H4v2h16V6h-6V3z"></path><path d="M5 9l1 12h12l1-12H5z"></path></svg>Delete</button>` : '');
       const actionHtml = `${editHtml} ${deleteHtml}`;
@@ -16,7 +88,7 @@ async function loadItems() {
         <td>${i.quantity}</td>
         <td>${i.reorder_level || 0}</td>
         <td>${i.price || 0}</td>
-        <td>${i.supplier_name || ''}</td>
+        <td>${supplier ? supplier.name : ''}</td>
         <td>${actionHtml}</td>
       `;
       tbody.appendChild(tr);
@@ -25,9 +97,7 @@ async function loadItems() {
   const spSelect = document.getElementById('item-supplier');
   if (spSelect) {
     spSelect.innerHTML = '<option value="">-- none --</option>';
-    const sres = await fetch('/api/suppliers');
-    const ss = await sres.json();
-    ss.forEach(s => {
+    cachedSuppliers().forEach(s => {
       const opt = document.createElement('option');
       opt.value = s.supplier_id;
       opt.textContent = s.name;
@@ -63,17 +133,32 @@ async function deleteItem(id) {
 }
 
 async function loadStockItems() {
-  const res = await fetch('/api/items');
-  const items = await res.json();
+  await syncChanges();
   const select = document.getElementById('item_id');
-  if (!select) return;
-  select.innerHTML = '';
-  items.forEach(i => {
-    const opt = document.createElement('option');
-    opt.value = i.id;
-    opt.textContent = `${i.name} (Qty: ${i.quantity})`;
-    select.appendChild(opt);
-  });
+  if (select) {
+    select.innerHTML = '';
+    cachedItems().sort((a, b) => a.name.localeCompare(b.name)).forEach(i => {
+      const opt = document.createElement('option');
+      opt.value = i.id;
+      opt.textContent = `${i.name} (Qty: ${i.quantity})`;
+      select.appendChild(opt);
+    });
+  }
+  const tbody = document.querySelector('#movements-table tbody');
+  if (tbody) {
+    tbody.innerHTML = '';
+    changeCache.movements.forEach(m => {
+      const item = changeCache.items.get(m.item_id);
+      if (!item) return;
+      const tr = document.createElement('tr');
+      [m.id, item.name, m.change, m.note || '', m.created_at].forEach(value => {
+        const td = document.createElement('td');
+        td.textContent = value;
+        tr.appendChild(td);
+      });
+      tbody.appendChild(tr);
+    });
+  }
 }
 
 async function addStock() {
@@ -183,8 +268,8 @@ try { if (window.feather) { window.feather.replace(); } } catch (e) {}
 async function loadSuppliers() {
   const tbody = document.querySelector('#suppliers-table tbody');
   if (!tbody) return;
-  const res = await fetch('/api/suppliers');
-  const data = await res.json();
+  await syncChanges();
+  const data = cachedSuppliers();
   tbody.innerHTML = '';
   data.forEach(s => {
     const tr = document.createElement('tr');